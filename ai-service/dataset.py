@@ -1,101 +1,327 @@
 
 import os
-import re
+import numpy as np
 import pandas as pd
 import glob
+import mmap
+from collections import Counter
+import numba
+from concurrent.futures import ThreadPoolExecutor
 from torch.utils.data import Dataset, ConcatDataset
 import torch
+from model import METHODS, METHOD_NAMES, encode_methods
+
+CSIC_CHUNK_SIZE = 50_000
+# Apache logs are scanned in windows of this many bytes / at most this many lines
+LOG_WINDOW_BYTES = 8 << 20
+LOG_WINDOW_ROWS = 16_384
+CSIC_FILE = 'csic_database.csv'
+GOOD_QUERIES_FILE = 'goodqueries.txt'
+BAD_QUERIES_FILE = 'badqueries.txt'
 
 class UnifiedDataset(Dataset):
-    def __init__(self, data):
+    def __init__(self, urls, methods, uas, labels, weights=None):
         """
-        data: list of dicts with keys ['url', 'method', 'user_agent', 'label']
+        Parallel columns, one entry per sample:
+        urls: list[str], methods: np.ndarray[int8] (METHODS index),
+        uas: list[str], labels: np.ndarray[int8],
+        weights: np.ndarray[float32] (number of raw samples each entry stands for, default 1)
         """
-        self.data = data
+        self.urls = urls
+        self.methods = methods
+        self.uas = uas
+        self.labels = labels
+        self.weights = np.ones(len(labels), dtype=np.float32) if weights is None else weights
     
     def __len__(self):
-        return len(self.data)
+        return len(self.labels)
     
     def __getitem__(self, idx):
-        return self.data[idx]
+        return {
+            'url': self.urls[idx],
+            'method': METHOD_NAMES[self.methods[idx]],
+            'user_agent': self.uas[idx],
+            'label': int(self.labels[idx]),
+            'weight': float(self.weights[idx])
+        }
+
+def empty_columns():
+    """
+    Returns the (urls, methods, uas, labels) lists every loader fills.
+    """
+    return [], [], [], []
+
+# Apache log line format:
+# - - [Date] "METHOD URL PROTOCOL" Status Size "Referrer" SessionID "UserAgent"
+# Example: - - [29/Oct/2019...] "GET /css/main.css HTTP/1.1" 200 764 "..." g2gh9... "Mozilla..."
+# The scanner accepts exactly the lines, and captures exactly the fields, of the original regex
+#   - - \[.*?\] "(.*?) (.*?) HTTP/.*?" \d+ \d+ "(.*?)" (\S+) "(.*?)"
+# applied to latin-1 text lines. Each lazy field ends at the earliest delimiter that lets the rest
+# of the line match, so quotes and spaces inside the request or referrer are backtracked over as
+# the regex did.
+_SPACE, _QUOTE, _LBRACKET, _RBRACKET, _NEWLINE, _CR = 32, 34, 91, 93, 10, 13
+
+@numba.njit(cache=True, inline='always')
+def _find(buf, start, end, ch):
+    for i in range(start, end):
+        if buf[i] == ch:
+            return i
+    return -1
+
+@numba.njit(cache=True, inline='always')
+def _find_eol(buf, start, end):
+    # Text-mode iteration splits lines on \n, \r and \r\n
+    for i in range(start, end):
+        if buf[i] == _NEWLINE or buf[i] == _CR:
+            return i
+    return -1
+
+@numba.njit(cache=True, inline='always')
+def _find_http(buf, start, end):
+    # Offset of the next " HTTP/"
+    for i in range(start, end - 5):
+        if buf[i] == _SPACE and buf[i + 1] == 72 and buf[i + 2] == 84 and buf[i + 3] == 84 \
+                and buf[i + 4] == 80 and buf[i + 5] == 47:
+            return i
+    return -1
+
+@numba.njit(cache=True, inline='always')
+def _is_space(c):
+    # Same set as the str regex \s over latin-1 text
+    return c == _SPACE or 9 <= c <= 13 or 28 <= c <= 31 or c == 0x85 or c == 0xA0
+
+@numba.njit(cache=True, inline='always')
+def _skip_digits(buf, start, end):
+    i = start
+    while i < end and 48 <= buf[i] <= 57:
+        i += 1
+    return i
+
+@numba.njit(cache=True, inline='always')
+def _match_tail(buf, q3, e, spans, n, base):
+    # "Referrer" SessionID "UserAgent", with q3 the referrer's opening quote
+    q4 = _find(buf, q3 + 1, e, _QUOTE)
+    while q4 >= 0:
+        if q4 + 2 < e and buf[q4 + 1] == _SPACE:
+            t = q4 + 2
+            while t < e and not _is_space(buf[t]):
+                t += 1
+            if t > q4 + 2 and t + 1 < e and buf[t] == _SPACE and buf[t + 1] == _QUOTE:
+                q6 = _find(buf, t + 2, e, _QUOTE)
+                if q6 >= 0:
+                    spans[n, 4] = q4 + 2 - base
+                    spans[n, 5] = t - base
+                    spans[n, 6] = t + 2 - base
+                    spans[n, 7] = q6 - base
+                    return True
+        q4 = _find(buf, q4 + 1, e, _QUOTE)
+    return False
+
+@numba.njit(cache=True, inline='always')
+def _match_status(buf, p, e, spans, n, base):
+    # Rest of the protocol, then " Status Size "
+    q2 = _find(buf, p, e, _QUOTE)
+    while q2 >= 0:
+        i = q2 + 1
+        if i < e and buf[i] == _SPACE:
+            j = _skip_digits(buf, i + 1, e)
+            if j > i + 1 and j < e and buf[j] == _SPACE:
+                k = _skip_digits(buf, j + 1, e)
+                if k > j + 1 and k + 1 < e and buf[k] == _SPACE and buf[k + 1] == _QUOTE \
+                        and _match_tail(buf, k + 1, e, spans, n, base):
+                    return True
+        q2 = _find(buf, q2 + 1, e, _QUOTE)
+    return False
+
+@numba.njit(cache=True, inline='always')
+def _match_request(buf, q1, e, spans, n, base):
+    # METHOD URL HTTP/..., with q1 the request's opening quote
+    sp1 = _find(buf, q1 + 1, e, _SPACE)
+    while sp1 >= 0:
+        h = _find_http(buf, sp1 + 1, e)
+        if h < 0:
+            # Later method ends only search less of the line
+            return False
+        while h >= 0:
+            if _match_status(buf, h + 6, e, spans, n, base):
+                spans[n, 0] = q1 + 1 - base
+                spans[n, 1] = sp1 - base
+                spans[n, 2] = sp1 + 1 - base
+                spans[n, 3] = h - base
+                return True
+            h = _find_http(buf, h + 1, e)
+        sp1 = _find(buf, sp1 + 1, e, _SPACE)
+    return False
+
+@numba.njit(cache=True, inline='always')
+def _parse_line(buf, s, e, spans, n, base):
+    """
+    Matches the line buf[s:e] and, if it matches, writes its method, url, sid and ua
+    [start, end) offsets (relative to base) into spans[n]. Returns whether it did.
+    """
+    # - - [Date] "
+    if e - s < 5 or buf[s] != 45 or buf[s + 1] != _SPACE or buf[s + 2] != 45 \
+            or buf[s + 3] != _SPACE or buf[s + 4] != _LBRACKET:
+        return False
+    b = _find(buf, s + 5, e, _RBRACKET)
+    while b >= 0:
+        if b + 2 < e and buf[b + 1] == _SPACE and buf[b + 2] == _QUOTE \
+                and _match_request(buf, b + 2, e, spans, n, base):
+            return True
+        b = _find(buf, b + 1, e, _RBRACKET)
+    return False
+
+@numba.njit(cache=True, nogil=True)
+def _apache_field_spans(buf, pos, limit, spans):
+    """
+    Scans the lines of buf that start in [pos, limit), stopping early once spans is full.
+    Fills spans with one row of offsets (relative to pos) per well-formed line.
+    Returns (rows written, offset of the first line not scanned).
+    """
+    base = pos
+    n = 0
+    while pos < limit and n < len(spans):
+        e = _find_eol(buf, pos, len(buf))
+        if e < 0:
+            e = len(buf)
+        if _parse_line(buf, pos, e, spans, n, base):
+            n += 1
+        pos = e + 1
+    return n, pos
+
+def parse_apache_batch(data, session_labels):
+    """
+    Parses a blob of Apache log lines (bytes or mmap) with the compiled scanner,
+    keeping lines whose raw session id is a key of session_labels (bytes -> label).
+    Returns (methods, urls, uas, labels); text fields are latin-1 decoded.
+    The blob is scanned in windows of LOG_WINDOW_BYTES, so working memory stays
+    bounded regardless of file size.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    spans = np.empty((LOG_WINDOW_ROWS, 8), dtype=np.int32)
+    # For mmaps, scanned pages are handed back to the OS so RSS stays near one window
+    release = data.madvise if isinstance(data, mmap.mmap) and hasattr(mmap, 'MADV_DONTNEED') else None
+    released = 0
+
+    methods, urls, uas, labels = [], [], [], []
+    pos = 0
+    while pos < len(buf):
+        base = pos
+        n, pos = _apache_field_spans(buf, base, min(base + LOG_WINDOW_BYTES, len(buf)), spans)
+        rows = spans[:n]
+        for k, (s0, s1) in enumerate(rows[:, 4:6].tolist()):
+            # Most lines belong to unlabelled sessions; reject them before decoding anything
+            label = session_labels.get(data[base + s0:base + s1])
+            if label is None:
+                continue
+            m0, m1, u0, u1, _, _, a0, a1 = rows[k].tolist()
+            methods.append(data[base + m0:base + m1].decode('latin-1'))
+            urls.append(data[base + u0:base + u1].decode('latin-1'))
+            uas.append(data[base + a0:base + a1].decode('latin-1'))
+            labels.append(label)
+
+        if release is not None:
+            done = min(pos, len(buf)) // mmap.PAGESIZE * mmap.PAGESIZE
+            if done > released:
+                release(mmap.MADV_DONTNEED, released, done - released)
+                released = done
+    return methods, urls, uas, labels
+
+def parse_file(log_file, session_labels):
+    """
+    Parses a single Apache log file, keeping lines from labelled sessions.
+    session_labels maps raw session id bytes to labels.
+    """
+    with open(log_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return empty_columns()
+        # Map the file instead of reading it; only the captured fields are ever copied out
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            methods, urls, uas, labels = parse_apache_batch(mm, session_labels)
+    return urls, encode_methods(methods), uas, labels
 
-def load_phase_data(data_dir):
+def find_annotation_files(data_dir):
+    return glob.glob(os.path.join(data_dir, "phase*", "annotations", "*", "train")) + \
+           glob.glob(os.path.join(data_dir, "phase*", "annotations", "*", "test"))
+
+def find_log_files(data_dir):
+    return glob.glob(os.path.join(data_dir, "phase*/data/web_logs/*/*.log"))
+
+def dataset_source_files(root_dir):
+    """
+    Lists every file get_combined_dataset reads, including ones that are missing.
+    """
+    return sorted(find_annotation_files(root_dir)) + sorted(find_log_files(root_dir)) + [
+        os.path.join(root_dir, name) for name in (CSIC_FILE, GOOD_QUERIES_FILE, BAD_QUERIES_FILE)
+    ]
+
+def load_phase_data(data_dir, max_workers=8):
     """
     Parses Phase 1 and Phase 2 logs and annotations.
     """
-    samples = []
+    urls, methods, uas, labels = columns = empty_columns()
     
     # Locate all annotation files
-    pattern = os.path.join(data_dir, "phase*", "annotations", "*", "train")
-    print(f"DEBUG: Looking for annotations with pattern: {pattern}")
-    annotation_files = glob.glob(pattern) + \
-                       glob.glob(os.path.join(data_dir, "phase*", "annotations", "*", "test"))
+    annotation_files = find_annotation_files(data_dir)
     print(f"DEBUG: Found {len(annotation_files)} annotation files: {annotation_files}")
     
-    # Load labels
+    # Load labels, keyed by raw bytes so log lines can be matched before decoding
     session_labels = {}
     for af in annotation_files:
-        with open(af, 'r') as f:
+        with open(af, 'rb') as f:
             for line in f:
-                parts = line.strip().split()
+                parts = line.split()
                 if len(parts) == 2:
                     sid, label = parts
-                    session_labels[sid] = 1 if 'bot' in label.lower() else 0
+                    session_labels[sid] = 1 if b'bot' in label.lower() else 0
                     
     # Locate log files
-    log_files = glob.glob(os.path.join(data_dir, "phase*/data/web_logs/*/*.log"))
+    log_files = find_log_files(data_dir)
     
-    # Apache log regex
-    # Format: - - [Date] "METHOD URL PROTOCOL" Status Size "Referrer" SessionID "UserAgent"
-    # Example: - - [29/Oct/2019...] "GET /css/main.css HTTP/1.1" 200 764 "..." g2gh9... "Mozilla..."
-    log_pattern = re.compile(r'- - \[.*?\] "(.*?) (.*?) HTTP/.*?" \d+ \d+ "(.*?)" (\S+) "(.*?)"')
+    # Read files concurrently; file I/O releases the GIL so reads overlap with parsing.
+    # map() yields results in submission order, keeping the sample order deterministic.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for f_urls, f_methods, f_uas, f_labels in executor.map(lambda lf: parse_file(lf, session_labels), log_files):
+            urls.extend(f_urls)
+            methods.extend(f_methods)
+            uas.extend(f_uas)
+            labels.extend(f_labels)
     
-    for lf in log_files:
-        with open(lf, 'r', encoding='latin-1') as f:
-            for line in f:
-                match = log_pattern.match(line)
-                if match:
-                    method, url, referrer, sid, ua = match.groups()
-                    sid = sid.strip()
-                    if sid in session_labels:
-                        samples.append({
-                            'url': url,
-                            'method': method,
-                            'user_agent': ua,
-                            'label': session_labels[sid]
-                        })
-    
-    print(f"Loaded {len(samples)} samples from Phase data")
-    return samples
+    print(f"Loaded {len(labels)} samples from Phase data")
+    return columns
 
 def load_csic_data(csv_path):
-    samples = []
+    urls, methods, uas, labels = columns = empty_columns()
     if not os.path.exists(csv_path):
         print(f"CSIC file not found: {csv_path}")
-        return samples
+        return columns
         
     try:
-        df = pd.read_csv(csv_path)
         # Columns: Method,User-Agent,...,classification,URL
-        for _, row in df.iterrows():
-            label = 0 if row['classification'] == 'Normal' else 1
-            samples.append({
-                'url': row['URL'],
-                'method': row['Method'],
-                'user_agent': row['User-Agent'],
-                'label': label
-            })
+        csv_columns = ['URL', 'Method', 'User-Agent', 'classification']
+        reader = pd.read_csv(
+            csv_path,
+            usecols=csv_columns,
+            dtype={c: 'string' for c in csv_columns},
+            chunksize=CSIC_CHUNK_SIZE,
+        )
+        for chunk in reader:
+            chunk = chunk.fillna('')
+            urls.extend(chunk['URL'].to_numpy())
+            methods.extend(encode_methods(chunk['Method'].to_numpy()))
+            uas.extend(chunk['User-Agent'].to_numpy())
+            labels.extend((chunk['classification'].to_numpy() != 'Normal').astype(np.int8))
     except Exception as e:
         print(f"Error loading CSIC data: {e}")
         
-    print(f"Loaded {len(samples)} samples from CSIC data")
-    return samples
+    print(f"Loaded {len(labels)} samples from CSIC data")
+    return columns
 
 def load_query_data(file_path, label, limit=50000):
-    samples = []
+    urls, methods, uas, labels = columns = empty_columns()
     if not os.path.exists(file_path):
         print(f"Query file not found: {file_path}")
-        return samples
+        return columns
         
     with open(file_path, 'r', encoding='latin-1') as f:
         for i, line in enumerate(f):
@@ -103,34 +329,47 @@ def load_query_data(file_path, label, limit=50000):
                 break
             url = line.strip()
             if url:
-                samples.append({
-                    'url': url,
-                    'method': 'GET', # Default
-                    'user_agent': '', # Default
-                    'label': label
-                })
-    print(f"Loaded {len(samples)} samples from {os.path.basename(file_path)}")
-    return samples
+                urls.append(url)
+                methods.append(METHODS['GET']) # Default
+                uas.append('') # Default
+                labels.append(label)
+    print(f"Loaded {len(labels)} samples from {os.path.basename(file_path)}")
+    return columns
 
 def get_combined_dataset(root_dir):
-    all_samples = []
-    
-    # 1. Phase Data
-    all_samples.extend(load_phase_data(root_dir))
-    
-    # 2. CSIC Data
-    all_samples.extend(load_csic_data(os.path.join(root_dir, 'csic_database.csv')))
+    sources = [
+        # 1. Phase Data
+        load_phase_data(root_dir),
+        # 2. CSIC Data
+        load_csic_data(os.path.join(root_dir, CSIC_FILE)),
+        # 3. Queries
+        load_query_data(os.path.join(root_dir, GOOD_QUERIES_FILE), 0),
+        load_query_data(os.path.join(root_dir, BAD_QUERIES_FILE), 1),
+    ]
     
-    # 3. Queries
-    all_samples.extend(load_query_data(os.path.join(root_dir, 'goodqueries.txt'), 0))
-    all_samples.extend(load_query_data(os.path.join(root_dir, 'badqueries.txt'), 1))
+    # Web logs repeat the same (method, url, ua) many times; keep one entry per distinct
+    # sample and carry its multiplicity as a weight instead
+    counts = Counter()
+    for s_urls, s_methods, s_uas, s_labels in sources:
+        counts.update(zip(s_methods, s_urls, s_uas, s_labels))
+    total = sum(counts.values())
+    print(f"Deduplicated {total} samples to {len(counts)} unique")
     
-    return UnifiedDataset(all_samples)
+    if not counts:
+        return UnifiedDataset([], np.empty(0, dtype=np.int8), [], np.empty(0, dtype=np.int8))
+    methods, urls, uas, labels = zip(*counts)
+    return UnifiedDataset(
+        list(urls),
+        np.array(methods, dtype=np.int8),
+        list(uas),
+        np.array(labels, dtype=np.int8),
+        np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    )
 
 if __name__ == "__main__":
     # Test loading
     ds = get_combined_dataset("../data")
-    print(f"Total Combined Samples: {len(ds)}")
+    print(f"Total Combined Samples: {len(ds)} unique, {int(ds.weights.sum())} total")
     if len(ds) > 0:
         print("Sample 0:", ds[0])
 
@@ -19,7 +19,7 @@ def debug():
     # 2. Load Model
     model = BotClassifier()
     try:
-        state = torch.load("model.pth")
+        state = torch.load("model.pth", map_location='cpu', mmap=True, weights_only=True)
         model.load_state_dict(state)
         model.eval()
         print("Model loaded.")
@@ -2,10 +2,12 @@
 from fastapi import FastAPI, HTTPException, Security, status, Depends
 from fastapi.security import APIKeyHeader
 from pydantic import BaseModel
+import asyncio
+import threading
 import torch
 import numpy as np
 import pickle
-from model import BotClassifier, extract_features
+from model import BotClassifier, fill_features_row
 import os
 from dotenv import load_dotenv, find_dotenv
 
@@ -14,6 +16,10 @@ load_dotenv(find_dotenv())
 app = FastAPI()
 
 # Security
+# API key auth is on unless ENABLE_API_KEY is explicitly false (e.g. local development
+# behind a trusted proxy); any other value, including typos, keeps it on
+API_KEY_DISABLED_VALUES = {"0", "false", "no", "off"}
+API_KEY_ENABLED = os.getenv("ENABLE_API_KEY", "1").strip().lower() not in API_KEY_DISABLED_VALUES
 api_key_header = APIKeyHeader(name="x-api-key", auto_error=False)
 
 def get_api_key(api_key_header: str = Security(api_key_header)):
@@ -36,17 +42,57 @@ def get_api_key(api_key_header: str = Security(api_key_header)):
         detail="Could not validate credentials"
     )
 
-# Global variables for model and stats
+# Global variables for model and stats, loaded once per process
 model = None
 stats = None
+model_lock = threading.Lock()
+
+# Micro-batching: concurrent /predict calls are coalesced into one forward pass
+MAX_BATCH = 32
+MAX_BATCH_WAIT = 0.002 # seconds
+batch_queue = None
+batch_task = None
+# Reused input buffer; only batch_worker touches it, so no locking is needed
+batch_buffer = np.empty((MAX_BATCH, 7), dtype=np.float32)
+batch_tensor = torch.from_numpy(batch_buffer) # shares memory with batch_buffer
 
 class RequestFeatures(BaseModel):
     url: str
     method: str = "GET"
     user_agent: str = ""
 
+def fold_normalization(model, mean, std):
+    """
+    Folds (x - mean) / std into the first Linear layer so raw features can be fed directly:
+    W' = W / std, b' = b - W' @ mean
+    """
+    first = model.network[0]
+    with torch.no_grad():
+        first.weight.div_(std)
+        first.bias.sub_(first.weight @ mean)
+
+def prepare_for_inference(model, stats):
+    """
+    Turns a trained BotClassifier into the graph /predict serves.
+    Everything here must keep rows independent: batch_worker runs requests from
+    different clients through one forward pass, so a row's score may not depend on
+    the rest of the batch. That rules out dynamic quantization, which picks one
+    activation scale per call across all rows.
+    """
+    model.eval()
+    if stats is not None:
+        fold_normalization(model, stats['mean'], stats['std'])
+    # Trace and freeze the eval-mode graph so each request skips per-op Python dispatch
+    with torch.no_grad():
+        return torch.jit.optimize_for_inference(torch.jit.trace(model, torch.zeros(1, 7)))
+
 @app.on_event("startup")
 def load_model():
+    with model_lock:
+        if model is None:
+            _load_model()
+
+def _load_model():
     global model, stats
     
     # 1. Load Stats
@@ -61,40 +107,72 @@ def load_model():
     # 2. Load Model
     try:
         model = BotClassifier()
-        model.load_state_dict(torch.load("model.pth"))
-        model.eval()
+        # mmap lets the OS page weights in on demand; weights_only skips the general unpickler
+        model.load_state_dict(torch.load("model.pth", map_location='cpu', mmap=True, weights_only=True))
+        model = prepare_for_inference(model, stats)
         print("Loaded model weights.")
     except FileNotFoundError:
         print("Model file not found. Run train.py first.")
         model = None
 
+async def batch_worker():
+    while True:
+        items = [await batch_queue.get()]
+        # Give concurrent requests a short window to join this batch
+        if batch_queue.qsize() < MAX_BATCH - 1:
+            await asyncio.sleep(MAX_BATCH_WAIT)
+        while len(items) < MAX_BATCH and not batch_queue.empty():
+            items.append(batch_queue.get_nowait())
+        
+        # Drop callers that went away while queued
+        items = [(sample, future) for sample, future in items if not future.done()]
+        if not items:
+            continue
+        
+        try:
+            # Features are written straight into the batch rows; no per-request arrays
+            for i, (sample, _) in enumerate(items):
+                fill_features_row(batch_buffer[i], sample)
+            with torch.no_grad():
+                scores = model(batch_tensor[:len(items)]).squeeze(1).tolist()
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        
+        for (_, future), score in zip(items, scores):
+            if not future.done():
+                future.set_result(score)
+
+@app.on_event("startup")
+async def start_batcher():
+    global batch_queue, batch_task
+    batch_queue = asyncio.Queue()
+    batch_task = asyncio.create_task(batch_worker())
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    if batch_task is not None:
+        batch_task.cancel()
+
 @app.get("/health")
 def health_check():
     return {"status": "ok", "model_loaded": model is not None}
 
-@app.post("/predict")
-def predict(features: RequestFeatures, api_key: str = Security(get_api_key)):
+@app.post("/predict", dependencies=[Security(get_api_key)] if API_KEY_ENABLED else [])
+async def predict(features: RequestFeatures):
     if model is None or stats is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
         
-    # Extract features
     # Convert Pydantic model to dict
     sample = features.dict()
     
-    # Extract
-    x = extract_features(sample)
-    
-    # Normalize
-    mean = stats['mean']
-    std = stats['std']
-    x = (x - mean.numpy()) / std.numpy() # Ensure numpy ops
-    
-    # Convert to Tensor
-    x_tensor = torch.tensor(x, dtype=torch.float32).unsqueeze(0) # Batch dim
-    
-    # Inference
-    with torch.no_grad():
-        score = model(x_tensor).item()
+    # Inference: queue for the next batched forward pass, which extracts features
+    # into its input buffer (normalization is folded into the model's first layer)
+    future = asyncio.get_running_loop().create_future()
+    await batch_queue.put((sample, future))
+    score = await future
         
     return {
         "bot_score": score,
@@ -5,10 +5,54 @@ import numpy as np
 
 # --- Feature Extraction ---
 METHODS = {'GET': 0, 'POST': 1, 'PUT': 2, 'DELETE': 3, 'HEAD': 4, 'OPTIONS': 5, 'CONNECT': 6, 'TRACE': 7, 'PATCH': 8}
+# METHODS index -> name
+METHOD_NAMES = list(METHODS)
 
-def extract_features(sample):
+# Byte translation tables, built from str.isdigit/isalnum so they agree with
+# those predicates on all of latin-1. Strings outside latin-1 (e.g. arbitrary
+# Unicode JSON sent to /predict) fall back to the predicates themselves.
+# _DIGIT_TRANS: 1 marks a digit, 0 everything else.
+# _URL_TRANS: 1 '/', 2 digit, 3 other alphanumeric, 4 other special character.
+_DIGIT_TRANS = bytes(1 if chr(i).isdigit() else 0 for i in range(256))
+_URL_TRANS = bytes(
+    1 if chr(i) == '/' else 2 if chr(i).isdigit() else 3 if chr(i).isalnum() else 4
+    for i in range(256)
+)
+
+def encode_methods(methods):
     """
-    Converts a sample dict to a feature vector.
+    Maps HTTP method strings to METHODS indices as an int8 array.
+    Each distinct spelling is upper-cased and looked up once, not once per sample.
+    """
+    lookup = {m: METHODS.get(m.upper(), 0) for m in set(methods)}
+    return np.fromiter((lookup[m] for m in methods), dtype=np.int8, count=len(methods))
+
+def _latin1(s):
+    try:
+        return s.encode('latin-1')
+    except UnicodeEncodeError:
+        return None
+
+def count_digits(s):
+    b = _latin1(s)
+    if b is None:
+        return sum(c.isdigit() for c in s)
+    return b.translate(_DIGIT_TRANS).count(b'\x01')
+
+def url_stats(url):
+    """
+    Returns (length, slashes, digits, specials) for a URL from a single classified buffer.
+    """
+    b = _latin1(url)
+    if b is None:
+        return len(url), url.count('/'), sum(c.isdigit() for c in url), sum(not c.isalnum() for c in url)
+    classes = b.translate(_URL_TRANS)
+    slashes = classes.count(b'\x01')
+    return len(url), slashes, classes.count(b'\x02'), slashes + classes.count(b'\x04')
+
+def fill_features_row(out_row, sample):
+    """
+    Writes the 7 features of a sample dict into out_row (any writable length-7 row) in place.
     """
     url = str(sample.get('url', ''))
     method = str(sample.get('method', 'GET')).upper()
@@ -18,25 +62,40 @@ def extract_features(sample):
     method_idx = METHODS.get(method, 0)
     
     # 2. URL Features
-    url_len = len(url)
-    url_depth = url.count('/')
-    url_digits = sum(c.isdigit() for c in url)
-    url_special = sum(not c.isalnum() for c in url)
+    url_len, url_depth, url_digits, url_special = url_stats(url)
     
     # 3. UA Features
     ua_len = len(ua)
-    ua_digits = sum(c.isdigit() for c in ua)
+    ua_digits = count_digits(ua)
     
     # Feature Vector (7 dims)
-    return np.array([
-        method_idx, 
-        url_len, 
-        url_depth, 
-        url_digits, 
-        url_special, 
-        ua_len, 
-        ua_digits
-    ], dtype=np.float32)
+    out_row[0] = method_idx
+    out_row[1] = url_len
+    out_row[2] = url_depth
+    out_row[3] = url_digits
+    out_row[4] = url_special
+    out_row[5] = ua_len
+    out_row[6] = ua_digits
+
+def extract_features(sample):
+    """
+    Converts a sample dict to a feature vector.
+    """
+    x = np.empty(7, dtype=np.float32)
+    fill_features_row(x, sample)
+    return x
+
+def extract_features_batch(urls, methods, uas):
+    """
+    Converts parallel url/method/ua columns to an (N, 7) feature matrix, one column at a time.
+    methods is the int8 METHODS index column from encode_methods.
+    """
+    X = np.empty((len(urls), 7), dtype=np.float32)
+    X[:, 0] = methods.astype(np.float32)
+    X[:, 1:5] = np.array([url_stats(u) for u in urls], dtype=np.float32).reshape(-1, 4)
+    X[:, 5] = [len(u) for u in uas]
+    X[:, 6] = [count_digits(u) for u in uas]
+    return X
 
 # --- Model Definition ---
 class BotClassifier(nn.Module):
@@ -0,0 +1,64 @@
+import io
+import re
+import pytest
+import numpy as np
+import dataset
+from dataset import UnifiedDataset, parse_apache_batch
+from model import encode_methods, extract_features, extract_features_batch
+
+# The pattern parse_apache_batch replaced, applied to text-mode lines as load_phase_data used to
+LOG_PATTERN = re.compile(r'- - \[.*?\] "(.*?) (.*?) HTTP/.*?" \d+ \d+ "(.*?)" (\S+) "(.*?)"')
+
+LABELS = {'sid1': 1, 'sid2': 0}
+
+LINES = [
+    '- - [29/Oct/2019:10:00:00 +0000] "GET /css/main.css HTTP/1.1" 200 764 "-" sid1 "Mozilla/5.0"',
+    '- - [29/Oct/2019:10:00:01 +0000] "POST /login HTTP/1.1" 302 0 "http://ref/" sid2 "curl/7.68.0"',
+    # Unlabelled and malformed
+    '- - [29/Oct/2019:10:00:02 +0000] "GET / HTTP/1.1" 200 5 "-" nobody "Mozilla/5.0"',
+    '- - [29/Oct/2019:10:00:03 +0000] "GET / HTTP/1.1" 200 - "-" sid1 "Mozilla/5.0"',
+    '- - [29/Oct/2019:10:00:04 +0000] "GET / HTTP/1.1" 200 5 "-" sid1  "Mozilla/5.0"',
+    '- - [29/Oct/2019:10:00:05 +0000] "GET / HTTP/1.1" 200 5 "-" sid1 "Mozilla/5.0',
+    '',
+    'garbage',
+    # Escaped quotes, spaces and brackets inside fields
+    '- - [29/Oct/2019:10:00:06 +0000] "GET /q?a=\\"x\\" HTTP/1.1" 200 5 "-" sid1 "Mozilla/5.0"',
+    '- - [29/Oct/2019:10:00:07 +0000] "GET /a b HTTP/1.1" 200 5 "r\\"ef" sid2 "sql\\"map"',
+    '- - [29/Oct/] 2019] "GET  /x HTTP/1.0" 404 9 "" sid1 ""',
+    '- - [d] "GET /p HTTP/1.1\\" 200 1 \\"" 200 5 "-" sid2 "UA" trailing "x"',
+    '- - [d] "GET /caf\xe9\xa0 HTTP/1.1" 200 5 "-" sid1 "\xc2\xa0UA"',
+    # Longer than one window
+    '- - [d] "GET /' + 'A' * 5000 + ' HTTP/1.1" 200 5 "-" sid2 "' + 'B' * 3000 + '"',
+]
+
+def reference_parse(data):
+    samples = []
+    for line in io.TextIOWrapper(io.BytesIO(data), encoding='latin-1'):
+        match = LOG_PATTERN.match(line)
+        if match:
+            method, url, referrer, sid, ua = match.groups()
+            if sid.strip() in LABELS:
+                samples.append((method, url, ua, LABELS[sid.strip()]))
+    return samples
+
+@pytest.mark.parametrize('window_bytes, window_rows', [(8 << 20, 16_384), (1, 1), (64, 2), (4096, 3)])
+@pytest.mark.parametrize('newline, last', [('\n', ''), ('\n', '\n'), ('\r\n', '\r\n'), ('\r', '')])
+def test_parse_apache_batch_matches_regex(monkeypatch, window_bytes, window_rows, newline, last):
+    monkeypatch.setattr(dataset, 'LOG_WINDOW_BYTES', window_bytes)
+    monkeypatch.setattr(dataset, 'LOG_WINDOW_ROWS', window_rows)
+    data = (newline.join(LINES) + last).encode('latin-1')
+    session_labels = {sid.encode(): label for sid, label in LABELS.items()}
+    expected = reference_parse(data)
+    assert len(expected) == 8
+    assert list(zip(*parse_apache_batch(data, session_labels))) == expected
+
+def test_parse_apache_batch_empty():
+    assert parse_apache_batch(b'', {b'sid1': 1}) == ([], [], [], [])
+
+def test_dataset_items_feed_extract_features():
+    urls, methods, uas = ['/a', '/b?x=1', '/c'], ['GET', 'post', 'PATCH'], ['ua', 'curl/7', '']
+    ds = UnifiedDataset(urls, encode_methods(methods), uas, np.array([0, 1, 0], dtype=np.int8))
+    expected = extract_features_batch(ds.urls, ds.methods, ds.uas)
+    for i in range(len(ds)):
+        assert ds[i]['method'] == methods[i].upper()
+        assert np.array_equal(extract_features(ds[i]), expected[i])
@@ -0,0 +1,73 @@
+import asyncio
+import importlib
+import pytest
+import torch
+from fastapi.testclient import TestClient
+import main
+from model import BotClassifier, extract_features
+
+BENIGN = {'url': '/css/main.css', 'method': 'GET', 'user_agent': 'Mozilla/5.0 (X11; Linux x86_64) Chrome/91.0'}
+EXTREME = {'url': '/' + '%27' * 2000, 'method': 'TRACE', 'user_agent': '9' * 4000}
+
+def make_model():
+    torch.manual_seed(0)
+    model = BotClassifier()
+    bn = model.network[2]
+    bn.running_mean.uniform_(-1, 1)
+    bn.running_var.uniform_(0.5, 2)
+    stats = {
+        'mean': torch.tensor([0.5, 30.0, 3.0, 2.0, 5.0, 100.0, 10.0]),
+        'std': torch.tensor([1.0, 20.0, 1.5, 3.0, 4.0, 40.0, 5.0]),
+    }
+    return main.prepare_for_inference(model, stats)
+
+def test_score_independent_of_batch_mates():
+    model = make_model()
+    benign = torch.from_numpy(extract_features(BENIGN))
+    extreme = torch.from_numpy(extract_features(EXTREME))
+    with torch.no_grad():
+        alone = model(benign.unsqueeze(0))[0]
+        batched = model(torch.stack([benign, extreme]))[0]
+    assert torch.allclose(alone, batched, rtol=0, atol=1e-6)
+
+def test_batch_worker_scores_match_single_requests():
+    main.model = make_model()
+
+    async def score(samples):
+        await main.start_batcher()
+        try:
+            futures = []
+            for sample in samples:
+                future = asyncio.get_running_loop().create_future()
+                await main.batch_queue.put((sample, future))
+                futures.append(future)
+            return await asyncio.gather(*futures)
+        finally:
+            await main.stop_batcher()
+
+    alone, = asyncio.run(score([BENIGN]))
+    batched = asyncio.run(score([BENIGN, EXTREME]))[0]
+    assert abs(alone - batched) <= 1e-6
+
+@pytest.fixture
+def reload_main(monkeypatch):
+    # API_KEY_ENABLED is read at import time, so each setting needs a fresh module
+    def reload(enable_api_key):
+        monkeypatch.setenv("ENABLE_API_KEY", enable_api_key)
+        monkeypatch.setenv("AI_CLASSIFIER_API_KEY", "secret")
+        return importlib.reload(main)
+    yield reload
+    monkeypatch.undo()
+    importlib.reload(main)
+
+@pytest.mark.parametrize("value", ["1", "true", "YES", "On", "enabled"])
+def test_api_key_required_unless_explicitly_disabled(reload_main, value):
+    client = TestClient(reload_main(value).app)
+    assert client.post("/predict", json=BENIGN).status_code == 403
+    # Past auth, the unloaded model answers 503
+    assert client.post("/predict", json=BENIGN, headers={"x-api-key": "secret"}).status_code == 503
+
+@pytest.mark.parametrize("value", ["0", "false", "No", "OFF"])
+def test_api_key_disabled(reload_main, value):
+    client = TestClient(reload_main(value).app)
+    assert client.post("/predict", json=BENIGN).status_code == 503
@@ -0,0 +1,14 @@
+from model import extract_features, url_stats
+
+def reference_url_stats(url):
+    return len(url), url.count('/'), sum(c.isdigit() for c in url), sum(not c.isalnum() for c in url)
+
+def test_url_stats_matches_str_predicates():
+    for url in ['/', '/login?user=%27%20OR%201=1', '/café/²', '/a/€/中/٣', '']:
+        assert url_stats(url) == reference_url_stats(url)
+
+def test_non_latin1_characters_are_counted():
+    x = extract_features({'url': '/a/€/中/٣', 'user_agent': '٣x'})
+    assert x[3] == 1 # '٣' (Arabic-Indic three) is a digit
+    assert x[4] == 5 # four slashes and '€'
+    assert x[6] == 1
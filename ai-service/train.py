@@ -2,66 +2,126 @@
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import DataLoader, random_split
-from dataset import get_combined_dataset
-from model import BotClassifier, extract_features
+import dataset as dataset_module
+import model as model_module
+from dataset import get_combined_dataset, dataset_source_files
+from model import BotClassifier, extract_features_batch
 import numpy as np
+import hashlib
 import pickle
 import os
 
+# --- Feature Cache ---
+FEATURES_CACHE = 'features_cache.npy'
+LABELS_CACHE = 'labels_cache.npy'
+WEIGHTS_CACHE = 'weights_cache.npy'
+CACHE_KEY_FILE = 'features_cache.key'
+
+def feature_cache_key(data_dir):
+    """
+    Hashes the path, mtime and size of every input file plus the feature code itself.
+    """
+    h = hashlib.sha256()
+    for path in dataset_source_files(data_dir) + [dataset_module.__file__, model_module.__file__]:
+        try:
+            st = os.stat(path)
+            h.update(f"{path}:{st.st_mtime_ns}:{st.st_size}\n".encode())
+        except FileNotFoundError:
+            h.update(f"{path}:missing\n".encode())
+    return h.hexdigest()
+
+def load_cached_features(key):
+    try:
+        with open(CACHE_KEY_FILE, 'r') as f:
+            if f.read().strip() != key:
+                return None
+        # Copy-on-write mmap: no read into memory up front, and torch.from_numpy gets a writable array
+        X = np.load(FEATURES_CACHE, mmap_mode='c')
+        y = np.load(LABELS_CACHE, mmap_mode='c')
+        w = np.load(WEIGHTS_CACHE, mmap_mode='c')
+    except (FileNotFoundError, ValueError):
+        return None
+    return X, y, w
+
+def save_cached_features(key, X, y, w):
+    np.save(FEATURES_CACHE, X)
+    np.save(LABELS_CACHE, y)
+    np.save(WEIGHTS_CACHE, w)
+    # Written last so an interrupted save is never mistaken for a valid cache
+    with open(CACHE_KEY_FILE, 'w') as f:
+        f.write(key)
+
+BATCH_SIZE = 64
+
 # --- Training Loop ---
 def train_model():
     print("Loading datasets...")
     data_dir = os.path.join(os.path.dirname(__file__), '../data')
-    full_dataset = get_combined_dataset(data_dir)
+    cache_key = feature_cache_key(data_dir)
+    cached = load_cached_features(cache_key)
     
-    if len(full_dataset) == 0:
-        print("No data found! Check paths.")
-        return
+    if cached is not None:
+        print(f"Loaded cached features from {FEATURES_CACHE}")
+        X_np, y_np, w_np = cached
+    else:
+        full_dataset = get_combined_dataset(data_dir)
+        
+        if len(full_dataset) == 0:
+            print("No data found! Check paths.")
+            return
 
-    # Precompute features
-    print("Extracting features...")
-    X = []
-    y = []
-    for sample in full_dataset.data:
-        X.append(extract_features(sample))
-        y.append(sample['label'])
+        # Precompute features
+        print("Extracting features...")
+        X_np = extract_features_batch(full_dataset.urls, full_dataset.methods, full_dataset.uas)
+        y_np = full_dataset.labels.astype(np.float32)
+        w_np = full_dataset.weights
+        save_cached_features(cache_key, X_np, y_np, w_np)
     
-    X = torch.tensor(np.array(X), dtype=torch.float32)
-    y = torch.tensor(np.array(y), dtype=torch.float32).unsqueeze(1)
+    X = torch.from_numpy(X_np)
+    y = torch.from_numpy(y_np).unsqueeze(1)
+    w = torch.from_numpy(w_np).unsqueeze(1)
     
-    # Normalize features
-    mean = X.mean(dim=0)
-    std = X.std(dim=0) + 1e-6
+    # Normalize features; weighted so the stats match those of the un-deduplicated data
+    total_weight = w.sum()
+    mean = (X * w).sum(dim=0) / total_weight
+    std = torch.sqrt((((X - mean) ** 2) * w).sum(dim=0) / (total_weight - 1)) + 1e-6
     X = (X - mean) / std
     
     # Save normalization stats
     with open('model_stats.pkl', 'wb') as f:
-        pickle.dump({'mean': mean, 'std': std}, f)
+        pickle.dump({'mean': mean, 'std': std}, f, protocol=5)
         
-    # Split
-    dataset = torch.utils.data.TensorDataset(X, y)
-    train_size = int(0.8 * len(dataset))
-    val_size = len(dataset) - train_size
-    train_ds, val_ds = random_split(dataset, [train_size, val_size])
-    
-    train_loader = DataLoader(train_ds, batch_size=64, shuffle=True)
-    val_loader = DataLoader(val_ds, batch_size=64)
+    # Split: everything stays in two contiguous tensors, batches are plain index/slice ops
+    train_size = int(0.8 * len(X))
+    val_size = len(X) - train_size
+    split = torch.randperm(len(X))
+    X_train, y_train, w_train = X[split[:train_size]], y[split[:train_size]], w[split[:train_size]]
+    X_val, y_val, w_val = X[split[train_size:]], y[split[train_size:]], w[split[train_size:]]
+    # An epoch is one pass over the unique samples, so it takes fewer optimizer steps than
+    # an epoch over the raw data did (by the dedup ratio); the weighted loss keeps each
+    # step's objective equal to the raw data's
+    num_batches = (train_size + BATCH_SIZE - 1) // BATCH_SIZE
     
     # Init Model
     model = BotClassifier(input_dim=X.shape[1])
-    criterion = nn.BCELoss()
+    # Per-sample losses are weighted by multiplicity, so each unique sample counts as often
+    # as it appeared in the raw data
+    criterion = nn.BCELoss(reduction='none')
     optimizer = optim.Adam(model.parameters(), lr=0.001)
     
-    print(f"Starting training on {len(X)} samples for 5 epochs...")
+    print(f"Starting training on {len(X)} unique samples ({int(total_weight)} total) for 5 epochs "
+          f"of {num_batches} steps...")
     
     for epoch in range(5):
         model.train()
         total_loss = 0
-        for batch_X, batch_y in train_loader:
+        perm = torch.randperm(train_size)
+        for i in range(0, train_size, BATCH_SIZE):
+            idx = perm[i:i + BATCH_SIZE]
+            batch_X, batch_y, batch_w = X_train[idx], y_train[idx], w_train[idx]
             optimizer.zero_grad()
             outputs = model(batch_X)
-            loss = criterion(outputs, batch_y)
+            loss = (criterion(outputs, batch_y) * batch_w).sum() / batch_w.sum()
             loss.backward()
             optimizer.step()
             total_loss += loss.item()
@@ -69,12 +129,14 @@ def train_model():
         model.eval()
         val_acc = 0
         with torch.no_grad():
-            for batch_X, batch_y in val_loader:
+            for i in range(0, val_size, BATCH_SIZE):
+                batch_X, batch_y = X_val[i:i + BATCH_SIZE], y_val[i:i + BATCH_SIZE]
+                batch_w = w_val[i:i + BATCH_SIZE]
                 outputs = model(batch_X)
                 predicted = (outputs > 0.5).float()
-                val_acc += (predicted == batch_y).sum().item()
+                val_acc += ((predicted == batch_y).float() * batch_w).sum().item()
         
-        print(f"Epoch {epoch+1}, Loss: {total_loss/len(train_loader):.4f}, Val Acc: {val_acc/val_size:.4f}")
+        print(f"Epoch {epoch+1}, Loss: {total_loss/num_batches:.4f}, Val Acc: {val_acc/w_val.sum().item():.4f}")
         
     torch.save(model.state_dict(), "model.pth")
     print("Model saved to model.pth")